@@ -0,0 +1,475 @@
+import os
+import asyncio
+import logging
+import time
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Dict, List, Optional, Any, Set, Tuple
+import singlestoredb as s2
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from cachetools import TTLCache
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Connection settings, read once at import rather than on every connect.
+# Required variables:
+#     SINGLESTORE_HOST: Database host address
+#     SINGLESTORE_PORT: Database port (default: 3306)
+#     SINGLESTORE_USER: Database username
+#     SINGLESTORE_PASSWORD: Database password
+#     SINGLESTORE_DATABASE: Target database name
+_REQUIRED_ENV = (
+    "SINGLESTORE_HOST",
+    "SINGLESTORE_USER",
+    "SINGLESTORE_PASSWORD",
+    "SINGLESTORE_DATABASE",
+)
+_CONN_KW: Dict[str, Any] = {
+    "host": os.getenv("SINGLESTORE_HOST"),
+    "port": int(os.getenv("SINGLESTORE_PORT", "3306")),
+    "user": os.getenv("SINGLESTORE_USER"),
+    "password": os.getenv("SINGLESTORE_PASSWORD"),
+    "database": os.getenv("SINGLESTORE_DATABASE"),
+    "results_type": "dict",  # Return results as dictionaries for easier JSON serialization
+    "autocommit": True,  # Negotiated by the driver during connect, no extra round-trip
+    # Stream rows from the server instead of buffering whole result sets. This
+    # applies to every pooled connection; helpers other than _execute read
+    # bounded results (LIMITed pages, information_schema) with fetchall(),
+    # which drains the stream, so none of them leave unread rows behind.
+    "buffered": False,
+}
+
+def check_config() -> None:
+    """
+    Verifies that all required connection settings are present.
+
+    Raises:
+        RuntimeError: If any required environment variable is missing
+    """
+    missing = [name for name in _REQUIRED_ENV if not os.getenv(name)]
+    if missing:
+        raise RuntimeError(f"Missing required environment variables: {', '.join(missing)}")
+
+# Process-wide connection pool so the TCP/TLS/auth handshake is paid once per
+# connection rather than once per request. Connections are opened lazily.
+_POOL_SIZE = int(os.getenv("SINGLESTORE_POOL_SIZE", "10"))
+_POOL_MAX_OVERFLOW = int(os.getenv("SINGLESTORE_POOL_MAX_OVERFLOW", "20"))
+POOL = QueuePool(
+    lambda: s2.connect(**_CONN_KW),
+    pool_size=_POOL_SIZE,
+    max_overflow=_POOL_MAX_OVERFLOW,
+    recycle=3600,  # Drop connections before server-side idle timeouts kick in
+)
+
+# Optional session settings (a "SET SESSION ..." statement) run
+# once when the pool opens a connection, so each checkout is ready to run
+# queries without further setup. Empty by default: no extra round-trip.
+_SESSION_INIT_SQL = os.getenv("SINGLESTORE_SESSION_INIT", "")
+
+@event.listens_for(POOL, "connect")
+def _on_connect(dbapi_conn, connection_record) -> None:
+    if _SESSION_INIT_SQL:
+        with dbapi_conn.cursor() as cur:
+            cur.execute(_SESSION_INIT_SQL)
+
+# Worker threads for blocking driver calls. Sized to the pool's maximum
+# checkout so a thread never sits waiting on a connection that can't exist.
+_DB_EXECUTOR = ThreadPoolExecutor(
+    max_workers=_POOL_SIZE + _POOL_MAX_OVERFLOW,
+    thread_name_prefix="s2db",
+)
+
+def get_db_connection():
+    """
+    Checks out a SingleStore database connection from the shared pool.
+
+    Calling close() on the returned connection hands it back to the pool
+    instead of closing the underlying socket.
+
+    Returns:
+        Pooled connection proxy wrapping a singlestoredb.Connection
+
+    Raises:
+        ConnectionError: If connection fails
+    """
+    try:
+        conn = POOL.connect()
+        logger.debug("Connections checked out: %d", POOL.checkedout())
+        return conn
+    except Exception as e:
+        logger.error("Database connection error", exc_info=True, extra={"op": "get_db_connection"})
+        raise ConnectionError("Database connection failed") from e
+
+def _json_default(value: Any) -> Any:
+    """Fallback for values orjson can't serialize natively (Decimal, bytes, ...)."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<binary len={len(value)}>"
+    return str(value)
+
+def dumps(payload: Any) -> str:
+    """Serializes a result payload to a JSON string."""
+    return orjson.dumps(
+        payload,
+        default=_json_default,
+        option=orjson.OPT_SERIALIZE_NUMPY,
+    ).decode()
+
+def _quote_ident(name: str) -> str:
+    """Backtick-quotes an identifier, escaping embedded backticks."""
+    return "`" + name.replace("`", "``") + "`"
+
+# Statement texts built once at import. Keeping them byte-identical across
+# calls lets SingleStore reuse its cached plans. Both are pinned to the
+# configured database rather than whatever DATABASE() a connection reports.
+_LIST_TABLES_SQL = (
+    "SELECT TABLE_NAME, TABLE_TYPE, TABLE_COMMENT, CREATE_TIME "
+    "FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s"
+)
+
+def _quote_literal_ident(name: str) -> str:
+    """
+    Quotes an identifier for a statement that the driver %-formats.
+
+    The driver applies ``query % args`` to the whole statement, so a '%' in a
+    table or database name has to be doubled to survive as a literal.
+    """
+    return _quote_ident(name).replace("%", "%%")
+
+def _read_table_prefix(database: str) -> str:
+    """Builds the start of the paged read, up to the table name."""
+    return "SELECT * FROM " + _quote_literal_ident(database) + "."
+
+# Concatenated rather than str.format()ed so braces in names are harmless
+_READ_TABLE_PREFIX = _read_table_prefix(_CONN_KW["database"] or "")
+_READ_TABLE_SUFFIX = " LIMIT %s OFFSET %s"
+
+# Rows pulled from the server per fetchmany() call when streaming results,
+# and the most rows execute_query will return for a single statement
+_FETCH_CHUNK_SIZE = 1000
+_MAX_QUERY_ROWS = int(os.getenv("SINGLESTORE_MAX_QUERY_ROWS", "100000"))
+
+def _fetch_tables() -> List[Dict[str, Any]]:
+    """Blocking lookup of the tables in the current database."""
+    with closing(get_db_connection()) as conn, conn.cursor() as cur:
+        cur.execute(_LIST_TABLES_SQL, (_CONN_KW["database"],))
+        return cur.fetchall()
+
+def _fetch_table_rows(resource_id: str, limit: int, offset: int) -> List[Dict[str, Any]]:
+    """Blocking read of one page of rows from a table."""
+    with closing(get_db_connection()) as conn, conn.cursor() as cur:
+        cur.execute(
+            _READ_TABLE_PREFIX + _quote_literal_ident(resource_id) + _READ_TABLE_SUFFIX,
+            (limit, offset),
+        )
+        return cur.fetchall()
+
+def _execute(query: str, parameters: Optional[Dict[str, Any]]) -> Tuple[str, bool]:
+    """
+    Blocking execution of a custom query.
+
+    Result rows are streamed from the server and serialized one chunk at a
+    time, so only _FETCH_CHUNK_SIZE row objects are held in memory at once.
+    At most _MAX_QUERY_ROWS rows are returned; the payload's "truncated"
+    flag is set when the result set had more; the connection is then
+    discarded rather than draining the unread rows off the socket.
+
+    Returns:
+        Tuple of the JSON payload and whether the statement returned rows
+    """
+    conn = get_db_connection()
+    invalidated = False
+    try:
+        with conn.cursor() as cur:
+            if parameters:
+                cur.execute(query, parameters)
+            else:
+                cur.execute(query)
+
+            if not cur.description:
+                return dumps({"affected_rows": cur.rowcount}), False
+
+            parts = []
+            remaining = _MAX_QUERY_ROWS
+            truncated = False
+            while True:
+                # Ask for one row past the cap so truncation can be detected
+                chunk = cur.fetchmany(min(_FETCH_CHUNK_SIZE, remaining + 1))
+                if not chunk:
+                    break
+                if len(chunk) > remaining:
+                    chunk = chunk[:remaining]
+                    truncated = True
+                if chunk:
+                    # Strip the enclosing brackets so chunks splice into one array
+                    parts.append(dumps(chunk)[1:-1])
+                    remaining -= len(chunk)
+                if truncated:
+                    break
+            if truncated:
+                # Closing an unbuffered cursor reads every remaining row off
+                # the wire; closing the socket first skips that
+                conn.invalidate()
+                invalidated = True
+            return (
+                '{"data":[' + ",".join(parts) + '],"truncated":'
+                + ("true" if truncated else "false") + "}"
+            ), True
+    finally:
+        if not invalidated and _may_change_session(query):
+            # USE, SET, user variables, temporary tables, locks and open
+            # transactions outlive the statement; drop the connection
+            # instead of handing that state to the next checkout
+            conn.invalidate()
+        conn.close()
+
+async def _run_blocking(func, *args):
+    """
+    Runs a blocking database helper in a worker thread.
+
+    The singlestoredb driver is synchronous, so calling it directly from a
+    handler would stall the event loop and serialize concurrent requests.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_DB_EXECUTOR, func, *args)
+
+# Tables in the current database, cached so reads don't pay an extra
+# information_schema round-trip just to validate the resource id. Holds the
+# fetch time, the set of names and the raw information_schema rows.
+_TABLE_CACHE_TTL = 30.0
+_TABLE_CACHE: Tuple[float, Set[str], List[Dict[str, Any]]] = (float("-inf"), set(), [])
+
+def _table_cache_fresh() -> bool:
+    """Returns True while the cached tables are within their TTL."""
+    return time.monotonic() - _TABLE_CACHE[0] <= _TABLE_CACHE_TTL
+
+# The refresh currently reading information_schema, shared by every caller
+# that finds the cache stale so a burst of requests issues a single query
+_TABLE_REFRESH: Optional["asyncio.Future[None]"] = None
+
+# Bumped by every invalidation so a refresh that started before it can tell
+# its result is already out of date
+_TABLE_CACHE_GENERATION = 0
+
+async def _load_table_cache() -> None:
+    """Reads the table list from information_schema into the cache."""
+    global _TABLE_CACHE
+    generation = _TABLE_CACHE_GENERATION
+    tables = await _run_blocking(_fetch_tables)
+    if generation != _TABLE_CACHE_GENERATION:
+        # Invalidated mid-read (e.g. a DROP TABLE); don't store a list that
+        # may predate the change
+        return
+    names = {table['TABLE_NAME'] for table in tables}
+    _TABLE_CACHE = (time.monotonic(), names, tables)
+
+def _table_refresh_in_flight() -> bool:
+    """Returns True while a table-list refresh is running."""
+    return _TABLE_REFRESH is not None and not _TABLE_REFRESH.done()
+
+def _table_refresh() -> "asyncio.Future[None]":
+    """Returns the in-flight table-list refresh, starting one if none is running."""
+    global _TABLE_REFRESH
+    if not _table_refresh_in_flight():
+        _TABLE_REFRESH = asyncio.ensure_future(_load_table_cache())
+    # Shield so one cancelled waiter doesn't cancel the refresh for the rest
+    return asyncio.shield(_TABLE_REFRESH)
+
+async def _refresh_table_cache() -> None:
+    """Re-reads the table list if the cache is older than _TABLE_CACHE_TTL seconds."""
+    # Loop because an invalidation can discard the refresh being waited on
+    while not _table_cache_fresh():
+        await _table_refresh()
+
+async def valid_tables() -> Set[str]:
+    """Returns the set of table names in the current database."""
+    await _refresh_table_cache()
+    return _TABLE_CACHE[1]
+
+def _invalidate_table_cache() -> None:
+    """Forces the next table lookup to re-read information_schema."""
+    global _TABLE_CACHE, _TABLE_CACHE_GENERATION, _TABLE_REFRESH
+    _TABLE_CACHE_GENERATION += 1
+    _TABLE_CACHE = (float("-inf"), set(), [])
+    # A refresh already in flight read the old schema; let the next lookup
+    # start a new one instead of joining it
+    _TABLE_REFRESH = None
+
+# Short-lived cache of serialized results for read-only queries
+_QUERY_CACHE_TTL = 15
+_QCACHE: TTLCache = TTLCache(maxsize=512, ttl=_QUERY_CACHE_TTL)
+
+# Cheap prefix test first; the compiled regex only runs on candidate reads
+_READ_PREFIXES = ("select", "show", "describe", "explain", "with")
+_WRITE_RE = re.compile(
+    r"\b(insert|update|delete|drop|alter|create|truncate|replace|grant|revoke)\b",
+    re.IGNORECASE,
+)
+
+def _is_read_only(query: str) -> bool:
+    """Returns True for a single statement that cannot modify data or schema."""
+    q = query.lstrip().lower()
+    if not q.startswith(_READ_PREFIXES):
+        return False
+    if ";" in q.rstrip().rstrip(";"):
+        return False
+    return _WRITE_RE.search(q) is None
+
+# Quoted strings and identifiers, removed before keyword matching so text
+# like 'a@b.com' or 'delete' inside a literal doesn't count as SQL
+_QUOTED_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|`(?:[^`]|``)*`")
+
+# Statements that leave state on the connection after they finish: current
+# database, session variables, temporary tables, table/named locks, open
+# transactions and user-variable assignments
+_SESSION_STATE_RE = re.compile(
+    r"(?:^|;)\s*(?:use|set|begin|start\s+transaction|lock\s+tables?)\b"
+    r"|\bcreate\s+temporary\b|:=|\binto\s+@|\bget_lock\s*\(",
+    re.IGNORECASE,
+)
+
+def _strip_quoted(query: str) -> str:
+    """Blanks out quoted strings and identifiers in a statement."""
+    return _QUOTED_RE.sub("''", query)
+
+def _may_change_session(query: str) -> bool:
+    """Returns True if a statement could leave state behind on its connection."""
+    return _SESSION_STATE_RE.search(_strip_quoted(query)) is not None
+
+# Statements that can create, drop or rename tables, and the server errors
+# (ER_BAD_TABLE_ERROR, ER_NO_SUCH_TABLE) that mean the table list is stale
+_DDL_RE = re.compile(r"\b(?:create|drop|alter|rename|truncate)\b", re.IGNORECASE)
+_MISSING_TABLE_ERRNOS = (1051, 1146)
+
+def _is_ddl(query: str) -> bool:
+    """Returns True if a statement could change the set of tables."""
+    return _DDL_RE.search(_strip_quoted(query)) is not None
+
+def _is_missing_table_error(exc: BaseException) -> bool:
+    """Returns True for driver errors reporting an unknown table."""
+    errno = getattr(exc, "errno", None)
+    if errno is None and exc.args:
+        errno = exc.args[0]
+    return errno in _MISSING_TABLE_ERRNOS
+
+def _query_cache_key(query: str, parameters: Any) -> bytes:
+    """Hashes a query and its parameters into a compact cache key."""
+    params = orjson.dumps(parameters or {}, default=_json_default, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(query.encode() + b"\0" + params, digest_size=16).digest()
+
+# Page size for table reads when the client doesn't ask for one, and the
+# upper bound on rows returned by a single read
+DEFAULT_READ_LIMIT = 1000
+MAX_READ_LIMIT = 10_000
+
+async def list_tables() -> List[Dict[str, Any]]:
+    """
+    Lists the tables in the current database.
+
+    The list is served from the table cache. The same list object is
+    returned until the cache is refreshed, so callers may memoize work
+    derived from it by identity.
+
+    Returns:
+        List of information_schema.TABLES rows (name, type, comment, create time)
+    """
+    await _refresh_table_cache()
+    return _TABLE_CACHE[2]
+
+def _page(rows: List[Dict[str, Any]], limit: int, offset: int) -> str:
+    """Serializes a page read with one row of look-ahead (limit + 1 rows)."""
+    return dumps({
+        "data": rows[:limit],
+        "offset": offset,
+        "limit": limit,
+        "has_more": len(rows) > limit,
+    })
+
+async def read_table(
+    resource_id: str, limit: int = DEFAULT_READ_LIMIT, offset: int = 0
+) -> str:
+    """
+    Reads one page of rows from a table.
+
+    Args:
+        resource_id: Table name; must exist in the current database
+        limit: Maximum number of rows to return (1 to MAX_READ_LIMIT)
+        offset: Number of rows to skip
+
+    Returns:
+        JSON payload of the form
+        {"data": [...], "offset": n, "limit": n, "has_more": bool}
+
+    Raises:
+        ValueError: If the paging arguments are invalid or the table doesn't exist
+    """
+    if not 1 <= limit <= MAX_READ_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_READ_LIMIT}")
+    if offset < 0:
+        raise ValueError("offset must be non-negative")
+    if _table_cache_fresh() or _table_refresh_in_flight():
+        # Validate first, waiting on any refresh another caller already
+        # started rather than adding a speculative read to the burst
+        if resource_id not in await valid_tables():
+            raise ValueError("Resource not found")
+        rows = await _run_blocking(_fetch_table_rows, resource_id, limit + 1, offset)
+        return _page(rows, limit, offset)
+
+    # Cache miss with no refresh running: refresh the table list and read the
+    # page concurrently on two pooled connections. The identifier is quoted,
+    # so the speculative read is safe; its result is discarded unless the
+    # table exists.
+    refreshed, rows = await asyncio.gather(
+        _table_refresh(),
+        _run_blocking(_fetch_table_rows, resource_id, limit + 1, offset),
+        return_exceptions=True,
+    )
+    if isinstance(refreshed, BaseException):
+        raise refreshed
+    # The refresh is discarded if the cache was invalidated while it ran
+    names = _TABLE_CACHE[1] if _table_cache_fresh() else await valid_tables()
+    if resource_id not in names:
+        raise ValueError("Resource not found")
+    if isinstance(rows, BaseException):
+        raise rows
+    return _page(rows, limit, offset)
+
+async def run_query(query: str, parameters: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Executes a custom SQL query.
+
+    Results of read-only queries are served from a short-lived cache; any
+    other statement clears it. DDL statements and
+    missing-table errors also invalidate the cached table list.
+
+    Returns:
+        JSON payload, {"data": [...]} for queries returning rows and
+        {"affected_rows": n} otherwise
+    """
+    cache_key = _query_cache_key(query, parameters) if _is_read_only(query) else None
+    if cache_key is not None:
+        cached = _QCACHE.get(cache_key)
+        if cached is not None:
+            return cached
+
+    try:
+        text, has_rows = await _run_blocking(_execute, query, parameters)
+    except Exception as e:
+        logger.error("Query execution error", exc_info=True, extra={"op": "execute_query"})
+        if _is_missing_table_error(e):
+            # The table was dropped behind the cache's back
+            _invalidate_table_cache()
+        raise
+
+    if _is_ddl(query):
+        _invalidate_table_cache()
+    if cache_key is None:
+        # Anything that isn't a plain read (writes, DDL, CALL, ...) may have
+        # changed the data behind cached results, whether or not it returned rows
+        _QCACHE.clear()
+    elif has_rows:
+        _QCACHE[cache_key] = text
+    return text
@@ -1,17 +1,28 @@
-import os
+import asyncio
 import logging
-from typing import Dict, List, Optional, Any
-import singlestoredb as s2
-from fastapi import FastAPI, HTTPException
+from typing import Dict, List, Optional, Any, Tuple
+from urllib.parse import parse_qs
+from fastapi import FastAPI
 from pydantic import BaseModel
-import json
 import mcp.server
 import mcp.server.models
 import mcp.server.stdio
 import mcp.types as types
+from pythonjsonlogger.json import JsonFormatter
 
-# Configure logging with INFO level to track all database operations
-logging.basicConfig(level=logging.INFO)
+from . import db
+
+try:
+    # Optional C event loop; falls back to the stdlib asyncio loop when absent
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Configure logging with INFO level to track all database operations.
+# Records are emitted as JSON (to stderr) so extra fields stay structured.
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(JsonFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+logging.basicConfig(level=logging.INFO, handlers=[_log_handler])
 logger = logging.getLogger(__name__)
 
 class QueryRequest(BaseModel):
@@ -41,99 +52,66 @@ class Resource(BaseModel):
 # Initialize FastAPI application
 app = FastAPI()
 
-def get_db_connection():
-    """
-    Creates and returns a SingleStore database connection.
-    
-    Environment Variables Required:
-        SINGLESTORE_HOST: Database host address
-        SINGLESTORE_PORT: Database port (default: 3306)
-        SINGLESTORE_USER: Database username
-        SINGLESTORE_PASSWORD: Database password
-        SINGLESTORE_DATABASE: Target database name
-    
-    Returns:
-        singlestoredb.Connection: Database connection object
-    
-    Raises:
-        HTTPException: If connection fails
-    """
-    try:
-        conn = s2.connect(
-            host=os.getenv("SINGLESTORE_HOST"),
-            port=int(os.getenv("SINGLESTORE_PORT", "3306")),
-            user=os.getenv("SINGLESTORE_USER"),
-            password=os.getenv("SINGLESTORE_PASSWORD"),
-            database=os.getenv("SINGLESTORE_DATABASE"),
-            results_type='dict'  # Return results as dictionaries for easier JSON serialization
-        )
-        return conn
-    except Exception as e:
-        logger.error(f"Database connection error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
 # Create MCP server instance
 server = mcp.server.Server("singlestore-server")
 
+# Resources built from the last table list seen, reused until db refreshes it
+_RESOURCES_CACHE: Tuple[Optional[List[Dict[str, Any]]], List[types.Resource]] = (None, [])
+
+async def _resources_cache() -> List[types.Resource]:
+    """Returns the MCP resources for the cached table list, rebuilding on refresh."""
+    global _RESOURCES_CACHE
+    tables = await db.list_tables()
+    source, resources = _RESOURCES_CACHE
+    if tables is not source:
+        # Values come straight from information_schema, so skip model validation
+        resources = [
+            types.Resource.model_construct(
+                id=table['TABLE_NAME'],
+                type="table",
+                attributes={
+                    "name": table['TABLE_NAME'],
+                    "type": table['TABLE_TYPE'],
+                    "comment": table['TABLE_COMMENT'],
+                    "created_at": table['CREATE_TIME'].isoformat() if table['CREATE_TIME'] else None
+                }
+            )
+            for table in tables
+        ]
+        _RESOURCES_CACHE = (tables, resources)
+    return resources
+
 # Add resource capabilities
 @server.list_resources()
 async def handle_list_resources() -> list[types.Resource]:
+    return await _resources_cache()
+
+def _parse_resource_id(resource_id: str) -> Tuple[str, int, int]:
+    """
+    Splits a resource id of the form "table?limit=N&offset=M" into the table
+    name and its paging values, defaulting to the first page.
+    
+    Raises:
+        ValueError: If limit or offset isn't an integer
+    """
+    name, _, query = str(resource_id).partition("?")
+    params = parse_qs(query)
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT 
-                    TABLE_NAME,
-                    TABLE_TYPE,
-                    TABLE_COMMENT,
-                    CREATE_TIME
-                FROM information_schema.TABLES 
-                WHERE TABLE_SCHEMA = DATABASE()
-            """)
-            tables = cur.fetchall()
-            
-            resources = []
-            for table in tables:
-                resource = types.Resource(
-                    id=table['TABLE_NAME'],
-                    type="table",
-                    attributes={
-                        "name": table['TABLE_NAME'],
-                        "type": table['TABLE_TYPE'],
-                        "comment": table['TABLE_COMMENT'],
-                        "created_at": table['CREATE_TIME'].isoformat() if table['CREATE_TIME'] else None
-                    }
-                )
-                resources.append(resource)
-            return resources
-    finally:
-        conn.close()
+        limit = int(params.get("limit", [db.DEFAULT_READ_LIMIT])[-1])
+        offset = int(params.get("offset", [0])[-1])
+    except ValueError:
+        raise ValueError("limit and offset must be integers")
+    return name, limit, offset
 
 @server.read_resource()
 async def handle_read_resource(resource_id: str) -> types.ResourceContent:
-    try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            # Verify table exists
-            cur.execute("""
-                SELECT TABLE_NAME 
-                FROM information_schema.TABLES 
-                WHERE TABLE_SCHEMA = DATABASE() 
-                AND TABLE_NAME = %s
-            """, (resource_id,))
-            
-            if not cur.fetchone():
-                raise ValueError("Resource not found")
-            
-            cur.execute(f"SELECT * FROM {resource_id}")
-            rows = cur.fetchall()
-            
-            return types.ResourceContent(
-                type="application/json",
-                content=json.dumps({"data": rows})
-            )
-    finally:
-        conn.close()
+    # Paging comes from the resource id's query string; the payload's
+    # has_more flag tells the client whether to request the next offset
+    name, limit, offset = _parse_resource_id(resource_id)
+    return types.ResourceContent(
+        type="application/json",
+        content=await db.read_table(name, limit, offset)
+    )
 
 # Add tool capabilities for custom queries
 @server.list_tools()
@@ -161,31 +139,15 @@ async def handle_list_tools() -> list[types.Tool]:
 async def handle_call_tool(name: str, arguments: dict) -> list[types.Content]:
     if name != "execute_query":
         raise ValueError(f"Unknown tool: {name}")
-        
-    try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            if arguments.get("parameters"):
-                cur.execute(arguments["query"], arguments["parameters"])
-            else:
-                cur.execute(arguments["query"])
-            
-            if cur.description:
-                rows = cur.fetchall()
-                return [types.TextContent(
-                    type="text",
-                    text=json.dumps({"data": rows})
-                )]
-            else:
-                return [types.TextContent(
-                    type="text",
-                    text=json.dumps({"affected_rows": cur.rowcount})
-                )]
-    finally:
-        conn.close()
+    
+    return [types.TextContent(
+        type="text",
+        text=await db.run_query(arguments["query"], arguments.get("parameters"))
+    )]
 
 # Main entry point
 async def main():
+    db.check_config()
     async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
         await server.run(
             read_stream,
@@ -198,5 +160,6 @@ async def main():
         )
 
 if __name__ == "__main__":
-    import asyncio
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     asyncio.run(main()) 
\ No newline at end of file
@@ -0,0 +1,450 @@
+import asyncio
+import datetime
+import time
+from decimal import Decimal
+
+import orjson
+import pytest
+from singlestoredb.exceptions import ProgrammingError
+from singlestore_mcp_server import db
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM t",
+    "  select id from t;",
+    "SHOW TABLES",
+    "describe t",
+    "EXPLAIN SELECT 1",
+    "WITH x AS (SELECT 1) SELECT * FROM x",
+    "SELECT updated_at FROM t",
+])
+def test_is_read_only_accepts_reads(query):
+    """Test that single read-only statements are recognised."""
+    assert db._is_read_only(query)
+
+@pytest.mark.parametrize("query", [
+    "INSERT INTO t VALUES (1)",
+    "UPDATE t SET a = 1",
+    "SELECT 1; DROP TABLE t",
+    "WITH x AS (SELECT 1) DELETE FROM t",
+    "SELECT * FROM t FOR UPDATE",
+])
+def test_is_read_only_rejects_writes(query):
+    """Test that writes and multi-statement queries are not treated as reads."""
+    assert not db._is_read_only(query)
+
+def test_quote_ident_escapes_backticks():
+    """Test that identifiers are backtick-quoted with embedded backticks doubled."""
+    assert db._quote_ident("users") == "`users`"
+    assert db._quote_ident("a`b") == "`a``b`"
+
+def test_dumps_handles_database_types():
+    """Test that common driver value types serialize to JSON."""
+    payload = db.dumps({"data": [{
+        "ts": datetime.datetime(2024, 1, 2, 3, 4, 5),
+        "amount": Decimal("1.50"),
+        "blob": b"\x00\x01\x02",
+    }]})
+    row = orjson.loads(payload)["data"][0]
+    assert row["ts"] == "2024-01-02T03:04:05"
+    assert row["amount"] == "1.50"
+    assert row["blob"] == "<binary len=3>"
+
+def test_query_cache_key_depends_on_parameters():
+    """Test that cache keys differ by parameters but not by dict ordering."""
+    key = db._query_cache_key("SELECT %(a)s", {"a": 1, "b": 2})
+    assert key == db._query_cache_key("SELECT %(a)s", {"b": 2, "a": 1})
+    assert key != db._query_cache_key("SELECT %(a)s", {"a": 2, "b": 2})
+
+@pytest.mark.asyncio
+async def test_read_table_rejects_bad_limit():
+    """Test that out-of-range page sizes are refused before touching the database."""
+    with pytest.raises(ValueError, match="limit"):
+        await db.read_table("t", limit=0)
+    with pytest.raises(ValueError, match="limit"):
+        await db.read_table("t", limit=db.MAX_READ_LIMIT + 1)
+
+@pytest.mark.asyncio
+async def test_list_tables_served_from_cache(monkeypatch):
+    """Test that the table list is fetched once per TTL and invalidated on demand."""
+    calls = []
+    def fake_fetch_tables():
+        calls.append(1)
+        return [{"TABLE_NAME": "users", "TABLE_TYPE": "BASE TABLE",
+                 "TABLE_COMMENT": "", "CREATE_TIME": None}]
+    monkeypatch.setattr(db, "_fetch_tables", fake_fetch_tables)
+    db._invalidate_table_cache()
+
+    first = await db.list_tables()
+    assert await db.list_tables() is first
+    assert await db.valid_tables() == {"users"}
+    assert len(calls) == 1
+
+    db._invalidate_table_cache()
+    assert await db.list_tables() is not first
+    assert len(calls) == 2
+    db._invalidate_table_cache()
+
+class FakeCursor:
+    """Minimal DB-API cursor returning canned rows in fetchmany() chunks."""
+    def __init__(self, rows=None, rowcount=0):
+        self.rows = list(rows) if rows is not None else None
+        self.description = [("id",)] if rows is not None else None
+        self.rowcount = rowcount
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, args=None):
+        self.executed.append((query, args))
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+class DrainingCursor(FakeCursor):
+    """Unbuffered cursor stand-in that drains unread rows on close unless the connection was dropped."""
+    def __init__(self, rows):
+        super().__init__(rows)
+        self.conn = None
+        self.drained = 0
+
+    def __exit__(self, *exc):
+        if not self.conn.invalidated:
+            self.drained, self.rows = len(self.rows), []
+        return False
+
+class FakeConnection:
+    """Pooled-connection stand-in recording whether it was invalidated."""
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.invalidated = False
+        self.closed = False
+
+    def cursor(self):
+        return self._cursor
+
+    def invalidate(self):
+        self.invalidated = True
+
+    def close(self):
+        self.closed = True
+
+@pytest.mark.parametrize("query, dirty", [
+    ("SELECT * FROM t", False),
+    ("INSERT INTO t VALUES (1)", False),
+    ("UPDATE t\nSET a = 1", False),
+    ("DELETE FROM t WHERE id = 1", False),
+    ("SELECT * FROM users WHERE email = 'a@b.com'", False),
+    ("SELECT REPLACE(name, 'a', 'b') FROM t", False),
+    ("SELECT * FROM audit WHERE action = 'delete'", False),
+    ("SELECT * FROM t WHERE note = 'USE x; SET y := 1'", False),
+    ("USE other_db", True),
+    ("SET SESSION sql_mode = ''", True),
+    ("set @x = 1", True),
+    ("SELECT @x := 1", True),
+    ("SELECT id INTO @v FROM t", True),
+    ("CREATE TEMPORARY TABLE tmp (id INT)", True),
+    ("LOCK TABLES t WRITE", True),
+    ("BEGIN", True),
+    ("START TRANSACTION", True),
+    ("SELECT GET_LOCK('x', 0)", True),
+    ("SELECT 1; USE other_db", True),
+])
+def test_execute_discards_connections_with_session_state(monkeypatch, query, dirty):
+    """Test that statements which may leave session state don't return their connection to the pool."""
+    conn = FakeConnection(FakeCursor(rows=[] if query.startswith("SELECT") else None))
+    monkeypatch.setattr(db, "get_db_connection", lambda: conn)
+    db._execute(query, None)
+    assert conn.invalidated is dirty
+    assert conn.closed
+
+def test_execute_returns_write_connections_to_pool(monkeypatch):
+    """Test that a plain INSERT hands its connection back for reuse."""
+    conn = FakeConnection(FakeCursor(rowcount=1))
+    monkeypatch.setattr(db, "get_db_connection", lambda: conn)
+    text, has_rows = db._execute("INSERT INTO t (email) VALUES ('a@b.com')", None)
+    assert (text, has_rows) == ('{"affected_rows":1}', False)
+    assert not conn.invalidated
+    assert conn.closed
+
+@pytest.mark.asyncio
+async def test_read_table_reports_has_more(monkeypatch):
+    """Test that pages read one row ahead and report whether more rows exist."""
+    table = [{"id": i} for i in range(5)]
+    def fake_fetch_table_rows(resource_id, limit, offset):
+        return table[offset:offset + limit]
+    monkeypatch.setattr(db, "_fetch_tables", lambda: [{"TABLE_NAME": "t"}])
+    monkeypatch.setattr(db, "_fetch_table_rows", fake_fetch_table_rows)
+    db._invalidate_table_cache()
+
+    first = orjson.loads(await db.read_table("t", limit=3))
+    assert first == {"data": table[:3], "offset": 0, "limit": 3, "has_more": True}
+    last = orjson.loads(await db.read_table("t", limit=3, offset=3))
+    assert last == {"data": table[3:], "offset": 3, "limit": 3, "has_more": False}
+    db._invalidate_table_cache()
+
+@pytest.fixture
+def fake_execute(monkeypatch):
+    """Replaces db._execute with a recorder whose result each test can set."""
+    calls = []
+    state = {"result": ('{"data":[]}', True), "error": None}
+    def execute(query, parameters):
+        calls.append(query)
+        if state["error"] is not None:
+            raise state["error"]
+        return state["result"]
+    monkeypatch.setattr(db, "_execute", execute)
+    db._QCACHE.clear()
+    yield calls, state
+    db._QCACHE.clear()
+    db._invalidate_table_cache()
+
+def _prime_table_cache(monkeypatch):
+    monkeypatch.setattr(db, "_fetch_tables", lambda: [{"TABLE_NAME": "t"}])
+    db._invalidate_table_cache()
+
+@pytest.mark.asyncio
+async def test_run_query_serves_repeated_reads_from_cache(fake_execute):
+    """Test that an identical read-only query is answered from the cache."""
+    calls, state = fake_execute
+    state["result"] = ('{"data":[{"id":1}]}', True)
+    assert await db.run_query("SELECT * FROM t", {"a": 1}) == '{"data":[{"id":1}]}'
+    assert await db.run_query("SELECT * FROM t", {"a": 1}) == '{"data":[{"id":1}]}'
+    assert len(calls) == 1
+    await db.run_query("SELECT * FROM t", {"a": 2})
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_run_query_does_not_cache_writes(fake_execute):
+    """Test that non-read statements always reach the database."""
+    calls, state = fake_execute
+    state["result"] = ('{"data":[]}', True)
+    await db.run_query("INSERT INTO t SELECT * FROM s")
+    await db.run_query("INSERT INTO t SELECT * FROM s")
+    assert len(calls) == 2
+    assert len(db._QCACHE) == 0
+
+@pytest.mark.asyncio
+async def test_run_query_without_rows_clears_caches(fake_execute, monkeypatch):
+    """Test that a statement with no result set drops the query and table caches."""
+    calls, state = fake_execute
+    _prime_table_cache(monkeypatch)
+    await db.valid_tables()
+    await db.run_query("SELECT 1")
+    assert len(db._QCACHE) == 1
+
+    state["result"] = ('{"affected_rows":1}', False)
+    assert await db.run_query("DROP TABLE t") == '{"affected_rows":1}'
+    assert len(db._QCACHE) == 0
+    assert not db._table_cache_fresh()
+
+@pytest.mark.asyncio
+async def test_run_query_write_keeps_table_cache(fake_execute, monkeypatch):
+    """Test that a non-DDL statement without rows leaves the table list cached."""
+    calls, state = fake_execute
+    _prime_table_cache(monkeypatch)
+    await db.valid_tables()
+    state["result"] = ('{"affected_rows":1}', False)
+    await db.run_query("INSERT INTO t (note) VALUES ('drop me')")
+    assert db._table_cache_fresh()
+
+@pytest.mark.asyncio
+async def test_run_query_missing_table_error_invalidates_table_cache(fake_execute, monkeypatch):
+    """Test that an unknown-table error re-raises and marks the table list stale."""
+    calls, state = fake_execute
+    _prime_table_cache(monkeypatch)
+    await db.valid_tables()
+    state["error"] = ProgrammingError(1146, "Table 'app.gone' doesn't exist")
+    with pytest.raises(ProgrammingError, match="doesn't exist"):
+        await db.run_query("SELECT * FROM gone")
+    assert not db._table_cache_fresh()
+    assert len(db._QCACHE) == 0
+
+@pytest.mark.asyncio
+async def test_run_query_other_error_keeps_table_cache(fake_execute, monkeypatch):
+    """Test that errors unrelated to missing tables leave the table list cached."""
+    calls, state = fake_execute
+    _prime_table_cache(monkeypatch)
+    await db.valid_tables()
+    state["error"] = ProgrammingError(1064, "You have an error in your SQL syntax")
+    with pytest.raises(ProgrammingError, match="syntax"):
+        await db.run_query("SELEC 1")
+    assert db._table_cache_fresh()
+
+def test_execute_splices_chunks_into_one_array(monkeypatch):
+    """Test that rows fetched over several fetchmany() calls form one JSON array."""
+    rows = [{"id": i} for i in range(2500)]
+    monkeypatch.setattr(db, "get_db_connection", lambda: FakeConnection(FakeCursor(rows)))
+    text, has_rows = db._execute("SELECT id FROM t", None)
+    assert has_rows
+    assert orjson.loads(text) == {"data": rows, "truncated": False}
+
+def test_execute_caps_rows_and_flags_truncation(monkeypatch):
+    """Test that results beyond the row cap are cut off and flagged."""
+    rows = [{"id": i} for i in range(2500)]
+    monkeypatch.setattr(db, "_MAX_QUERY_ROWS", 1500)
+    monkeypatch.setattr(db, "get_db_connection", lambda: FakeConnection(FakeCursor(rows)))
+    payload = orjson.loads(db._execute("SELECT id FROM t", None)[0])
+    assert payload == {"data": rows[:1500], "truncated": True}
+
+def test_execute_at_exact_cap_is_not_truncated(monkeypatch):
+    """Test that a result exactly at the row cap isn't flagged as truncated."""
+    rows = [{"id": i} for i in range(2000)]
+    monkeypatch.setattr(db, "_MAX_QUERY_ROWS", 2000)
+    monkeypatch.setattr(db, "get_db_connection", lambda: FakeConnection(FakeCursor(rows)))
+    payload = orjson.loads(db._execute("SELECT id FROM t", None)[0])
+    assert payload == {"data": rows, "truncated": False}
+
+def test_execute_truncation_skips_draining_unread_rows(monkeypatch):
+    """Test that a truncated result drops the connection instead of reading the remaining rows."""
+    rows = [{"id": i} for i in range(2500)]
+    monkeypatch.setattr(db, "_MAX_QUERY_ROWS", 1500)
+    cur = DrainingCursor(rows)
+    conn = cur.conn = FakeConnection(cur)
+    monkeypatch.setattr(db, "get_db_connection", lambda: conn)
+    payload = orjson.loads(db._execute("SELECT id FROM t", None)[0])
+    assert payload["truncated"]
+    assert conn.invalidated
+    assert cur.drained == 0
+    assert len(cur.rows) == 2500 - 1501
+
+def test_execute_untruncated_keeps_connection(monkeypatch):
+    """Test that a fully read result hands its connection back to the pool."""
+    conn = FakeConnection(FakeCursor([{"id": 1}]))
+    monkeypatch.setattr(db, "get_db_connection", lambda: conn)
+    db._execute("SELECT id FROM t", None)
+    assert not conn.invalidated
+    assert conn.closed
+
+def test_get_db_connection_raises_connection_error(monkeypatch):
+    """Test that pool failures surface as a transport-neutral ConnectionError."""
+    def fail():
+        raise OSError("connection refused")
+    monkeypatch.setattr(db.POOL, "connect", fail)
+    with pytest.raises(ConnectionError, match="Database connection failed"):
+        db.get_db_connection()
+
+@pytest.fixture
+def stale_tables(monkeypatch):
+    """Starts each test with an empty table cache and no refresh in flight."""
+    monkeypatch.setattr(db, "_TABLE_REFRESH", None)
+    db._invalidate_table_cache()
+    yield
+    db._invalidate_table_cache()
+
+@pytest.mark.asyncio
+async def test_concurrent_refreshes_share_one_query(monkeypatch, stale_tables):
+    """Test that callers finding the cache stale together issue one information_schema query."""
+    calls = []
+    def slow_fetch_tables():
+        calls.append(1)
+        time.sleep(0.05)
+        return [{"TABLE_NAME": "t"}]
+    reads = []
+    def fake_fetch_table_rows(resource_id, limit, offset):
+        reads.append(resource_id)
+        return []
+    monkeypatch.setattr(db, "_fetch_tables", slow_fetch_tables)
+    monkeypatch.setattr(db, "_fetch_table_rows", fake_fetch_table_rows)
+
+    results = await asyncio.gather(
+        db.list_tables(), db.valid_tables(), db.read_table("t"), db.read_table("t"),
+    )
+    assert len(calls) == 1
+    assert results[1] == {"t"}
+    assert len(reads) == 2
+
+@pytest.mark.asyncio
+async def test_read_table_missing_table_hides_read_error(monkeypatch, stale_tables):
+    """Test that a failed speculative read of a missing table reports "Resource not found"."""
+    def failing_read(resource_id, limit, offset):
+        raise RuntimeError("Table 'nope' doesn't exist")
+    monkeypatch.setattr(db, "_fetch_tables", lambda: [{"TABLE_NAME": "t"}])
+    monkeypatch.setattr(db, "_fetch_table_rows", failing_read)
+    with pytest.raises(ValueError, match="Resource not found"):
+        await db.read_table("nope")
+
+@pytest.mark.asyncio
+async def test_read_table_existing_table_reraises_read_error(monkeypatch, stale_tables):
+    """Test that a failed read of an existing table propagates the driver error."""
+    def failing_read(resource_id, limit, offset):
+        raise RuntimeError("read timed out")
+    monkeypatch.setattr(db, "_fetch_tables", lambda: [{"TABLE_NAME": "t"}])
+    monkeypatch.setattr(db, "_fetch_table_rows", failing_read)
+    with pytest.raises(RuntimeError, match="read timed out"):
+        await db.read_table("t")
+
+@pytest.mark.asyncio
+async def test_read_table_reraises_refresh_error(monkeypatch, stale_tables):
+    """Test that a failed table-list refresh propagates and leaves the cache stale."""
+    def failing_fetch_tables():
+        raise RuntimeError("information_schema unavailable")
+    monkeypatch.setattr(db, "_fetch_tables", failing_fetch_tables)
+    monkeypatch.setattr(db, "_fetch_table_rows", lambda resource_id, limit, offset: [])
+    with pytest.raises(RuntimeError, match="information_schema unavailable"):
+        await db.read_table("t")
+    assert not db._table_cache_fresh()
+
+@pytest.mark.asyncio
+async def test_invalidation_during_refresh_discards_stale_list(monkeypatch, stale_tables):
+    """Test that a refresh started before an invalidation doesn't store its now-stale table list."""
+    listings = [[{"TABLE_NAME": "old"}], [{"TABLE_NAME": "new"}]]
+    def slow_fetch_tables():
+        time.sleep(0.05)
+        return listings.pop(0)
+    monkeypatch.setattr(db, "_fetch_tables", slow_fetch_tables)
+
+    waiter = asyncio.ensure_future(db.valid_tables())
+    await asyncio.sleep(0.01)
+    db._invalidate_table_cache()
+    assert await waiter == {"new"}
+    assert not listings
+    assert await db.valid_tables() == {"new"}
+
+@pytest.mark.asyncio
+async def test_read_table_refetches_after_invalidation_mid_refresh(monkeypatch, stale_tables):
+    """Test that the cache-miss path validates against a fresh list if its refresh was discarded."""
+    listings = [[], [{"TABLE_NAME": "t"}]]
+    def slow_fetch_tables():
+        time.sleep(0.05)
+        return listings.pop(0)
+    monkeypatch.setattr(db, "_fetch_tables", slow_fetch_tables)
+    monkeypatch.setattr(db, "_fetch_table_rows", lambda resource_id, limit, offset: [{"id": 1}])
+
+    reader = asyncio.ensure_future(db.read_table("t"))
+    await asyncio.sleep(0.01)
+    db._invalidate_table_cache()
+    assert orjson.loads(await reader)["data"] == [{"id": 1}]
+    assert not listings
+
+def test_read_table_sql_survives_percent_in_table_name(monkeypatch):
+    """Test that a '%' in a table name isn't treated as a format directive."""
+    cur = FakeCursor(rows=[])
+    monkeypatch.setattr(db, "get_db_connection", lambda: FakeConnection(cur))
+    monkeypatch.setattr(db, "_READ_TABLE_PREFIX", db._read_table_prefix("app"))
+    db._fetch_table_rows("50%_off", 10, 0)
+    query, args = cur.executed[0]
+    assert query % args == "SELECT * FROM `app`.`50%_off` LIMIT 10 OFFSET 0"
+
+def test_read_table_sql_survives_braces_and_percent_in_database_name():
+    """Test that braces and '%' in the configured database name are kept literally."""
+    query = db._read_table_prefix("app{prod}%") + "`t`" + db._READ_TABLE_SUFFIX
+    assert query % (10, 0) == "SELECT * FROM `app{prod}%`.`t` LIMIT 10 OFFSET 0"
+
+@pytest.mark.asyncio
+async def test_run_query_non_read_with_rows_clears_cache(fake_execute):
+    """Test that a non-read statement returning rows still drops cached reads."""
+    calls, state = fake_execute
+    await db.run_query("SELECT * FROM t")
+    assert len(db._QCACHE) == 1
+    state["result"] = ('{"data":[{"updated":1}]}', True)
+    await db.run_query("CALL refresh_totals()")
+    assert len(db._QCACHE) == 0